@@ -45,6 +45,12 @@
     SQLSRV = True
 except ImportError:
     SQLSRV = False
+    
+try:
+    import orjson # optional faster JSON decoding
+    ORJSON = True
+except ImportError:
+    ORJSON = False
 
 DENC = 'utf-8' # default encoding for text values
 ISO_DATE_REGEX = re.compile(r'^\d{4}-\d{2}-\d{2}$') # ISO8601 YYYY-MM-DD
@@ -87,7 +93,7 @@ def adapt_pickle(val):
     if SQLSRV:
         return pickle.dumps(val, protocol=0) if val is not None else None # returns human readable bytes (driver throws error \x00 bytes in stream)
     else:
-        return pickle.dumps(val) if val is not None else None # bytes
+        return pickle.dumps(val, protocol=pickle.HIGHEST_PROTOCOL) if val is not None else None # bytes (most compact and fastest format)
 
 # Converter functions = convert/cast a stored object from the database into a custom Python type
 # NOTE input to convert_ functions is bytes from database, output is a Python object
@@ -121,14 +127,23 @@ def convert_boolbool(val): # assumes underlying storage is boolean
 def convert_boolint(val):
     return int(val) if val is not None else None
 
+if ORJSON:
+    def json_loads(val): 
+        try:
+            return orjson.loads(val)
+        except orjson.JSONDecodeError: # eg NaN or Infinity as written by json.dumps, integers over 64 bits
+            return json.loads(val)
+else:
+    json_loads = json.loads
+
 def convert_json(val, cur=None): #  PostGres compatible typecaster
-    return json.loads(val) if val is not None else None # accepts str, bytes or bytearray + unicode as input
+    return json_loads(val) if val is not None else None # accepts str, bytes or bytearray + unicode as input
 
 def convert_jsonset(val): 
-    return set(json.loads(val)) if val is not None else None
+    return set(json_loads(val)) if val is not None else None
         
 def convert_jsontuple(val): 
-    return tuple(json.loads(val)) if val is not None else None
+    return tuple(json_loads(val)) if val is not None else None
         
 def postcast_jsonset(val): 
     return set(val) if isinstance(val, list) else val
@@ -137,7 +152,11 @@ def postcast_jsontuple(val):
     return tuple(val) if isinstance(val, list) else val
     
 def convert_isodate(val): # retrieve internal ISO date (bytes) as date object
-    return date(*map(int, val.split(b'-'))) if val is not None else None
+    if val is None: return None
+    try:
+        return date.fromisoformat(val.decode()) # fast path for standard format
+    except ValueError: # eg unpadded month or day
+        return date(*map(int, val.split(b'-')))
     
 def convert_dateiso(val): # retrieve date/time object as ISO unicode date
     return val.isoformat() if val is not None else None 
@@ -147,6 +166,10 @@ def convert_timeiso(val): # retrieve time object as ISO unicode time
 
 def convert_isodtime(val): # retrieve internal ISO datetime (bytes) as datetime object
     if val is None: return None
+    try:
+        return datetime.fromisoformat(val.decode()) # fast path for standard format, deals with ' ' or 'T' as separator
+    except ValueError: # eg unpadded fields or non standard fractions of a second
+        pass
     sep = val[10:11]
     datepart, timepart = val.split(sep) # deals with ' ' or 'T' as separator
     year, month, day = map(int, datepart.split(b'-'))
@@ -160,6 +183,10 @@ def convert_isodtime(val): # retrieve internal ISO datetime (bytes) as datetime
     
 def convert_isotime(val): # retrieve internal ISO time (bytes) as time object
     if val is None: return None
+    try:
+        return time.fromisoformat(val.decode()) # fast path for standard format
+    except ValueError: # eg unpadded fields or non standard fractions of a second
+        pass
     timepart_full = val.split(b'.')
     hours, minutes, seconds = map(int, timepart_full[0].split(b':'))
     if len(timepart_full) == 2:
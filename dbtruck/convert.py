@@ -20,6 +20,7 @@
 import re
 import datetime
 from collections import OrderedDict
+from functools import lru_cache
 
 from .adapcast import Pickle
 
@@ -30,6 +31,7 @@
 ]
 
 IDENT_NOQUOTE = re.compile(r'^[a-z][a-z_0-9]*$')
+NON_ALNUM = re.compile(r'[^a-zA-Z0-9]')
 
 def clean_data(data, remove_none=True, pickle_unknown=True):
     # Turns it into a list of lists of (key, value) tuples (+optional step to remove items with None values).
@@ -69,7 +71,7 @@ def clean_data(data, remove_none=True, pickle_unknown=True):
   return cleaned
 
 def simplify(val):
-  return re.sub(r'[^a-zA-Z0-9]', '', val)
+  return NON_ALNUM.sub('', val)
 
 def quote(val):
   'Handle quote characters'
@@ -87,6 +89,7 @@ def quote(val):
   #Darn
   raise ValueError('The value "%s" is not quoted and contains too many quote characters to quote' % text)
       
+@lru_cache(maxsize=1024) # the same table and column names are quoted over and over
 def iquote(text, force=False, qchar='"'): # quote identifiers
     """Quotes added if the string contains non-identifier characters or capital letters 
     Usually added only if necessary but can be forced
@@ -109,6 +112,35 @@ def nquote(text): # quote nullable/literal
         text = text.replace("'", "''")
     return "'%s'" % text
 
+def convert_csv_value(v): 
+    """ Convert a value read by a QUOTE_NONNUMERIC csv reader 
+    An empty string is null and integral floats become integers """
+    if isinstance(v, str) and v == '':
+        return None
+    elif isinstance(v, float) and v.is_integer():
+        return int(v)
+    return v
+    
+def csv_row_converter(sample_rows, width): 
+    """ Generate a function converting a csv row into a tuple of width values (see convert_csv_value)
+    The code is specialised on the column types found in the sample rows, 
+    each column falls back to convert_csv_value for any other type """
+    if not width:
+        return lambda r: ()
+    exprs = []
+    for i in range(width):
+        types = set(type(row[i]) for row in sample_rows if i < len(row))
+        if types == {str}:
+            exprs.append('((r[%d] or None) if r[%d].__class__ is str else cv(r[%d]))' % (i, i, i))
+        elif types == {float}:
+            exprs.append('((int(r[%d]) if r[%d].is_integer() else r[%d]) if r[%d].__class__ is float else cv(r[%d]))' % (i, i, i, i, i))
+        else:
+            exprs.append('cv(r[%d])' % i)
+    src = 'def convert_row(r): return (%s,)' % ', '.join(exprs)
+    namespace = { 'cv': convert_csv_value }
+    exec(compile(src, '<csv_row_converter>', 'exec'), namespace)
+    return namespace['convert_row']
+
 def checkdata(data):
   for key, value in data.items():
     # Column names
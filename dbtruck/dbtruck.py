@@ -19,11 +19,17 @@
 from urllib.parse import urlsplit
 from collections import OrderedDict
 import re
+import csv
+from datetime import date, datetime
+from itertools import islice, chain, groupby
 
-from .convert import nquote, simplify, iquote
+from .convert import nquote, simplify, iquote, csv_row_converter
 from . import adapcast
 from .adapcast import Pickle, ISODate, ISODateTime, ISODateTTime, postcast_text as text
 
+DDL_REGEX = re.compile(r'\s*(IF\s.*\)\s*)?(ALTER|DROP)\s', re.IGNORECASE|re.DOTALL) # statements that can invalidate cached columns and prepared queries
+PYFORMAT_REGEX = re.compile(r'%%|%s') # escaped percent signs and pyformat place holders
+
 class Store(object):
 
     # A class to control a connection to an SQLite, MySQL, Postgres or SQL Server database - based on the old ScraperWiki dumptruck module
@@ -35,15 +41,20 @@ class Store(object):
     """
 
     _poss_db_types = [ 'SQLITE', 'POSTGRESQL', 'MYSQL', 'SQLSERVER' ] # just an aide memoire not used
+    _prep_cache_size = 128 # max number of repeated queries tracked for server side prepared statements (PostgreSQL)
+    _sqlite_cached_statements = 512 # size of the sqlite3 module's own compiled statement cache (default 128)
   
     def __init__(self, connect_details, data_table = 'dbtruckdata', vars_table = 'dbtruckvars', default_commit = True, 
             timeout = 5, json_str_output = False, dates_str_output = False, bool_int_output = False, sqlite_t_sep = False,
-            has_rowids = False, text_key_width = 100):
+            has_rowids = False, text_key_width = 100, sqlite_wal = False):
                 
         # note that sqlite_t_sep just specifies the internal storage format for SQLite datetimes
         # the string output of dates is always ISO8601 format (T separator)
         
         # note that text_key_width only sets the fixed size of text fields in MySQL and SQL Server databases used as keys or in indexes
+        
+        # note that sqlite_wal switches SQLite to write-ahead logging with synchronous=NORMAL - much faster commits,
+        # safe against application crashes but the last transactions can be lost on power failure
                         
         _tables = [] # current sorted list of tables in the store
             
@@ -72,6 +83,7 @@ def __init__(self, connect_details, data_table = 'dbtruckdata', vars_table = 'db
         self._text_key_width = text_key_width
         
         self._qchar = '"' # default quote character for identifiers
+        self._sqlite_t_sep = False # non-standard 'T' separator for stored datetimes applies to SQLite only
         self.db_type = Store.type_from_uri(connect_details).upper()
         if self.db_type == 'POSTGRESQL':
             if not hasattr(adapcast, 'POSTGRES_CREATE_SEQ'):
@@ -117,7 +129,7 @@ def __init__(self, connect_details, data_table = 'dbtruckdata', vars_table = 'db
             self.connection.setautocommit(False)
         else:
             self.db_type = 'SQLITE'
-            self._sqlite_t_sep = sqlite_t_sep
+            self._sqlite_t_sep = bool(sqlite_t_sep)
             if self._sqlite_t_sep: # non-standard separator for date times on SQLite can be a 'T'
                 self._create_sequence = adapcast.SQLITE_T_CREATE_SEQ
                 self._adapt_map = adapcast.SQLITE_T_ADAPTER_MAP
@@ -130,9 +142,13 @@ def __init__(self, connect_details, data_table = 'dbtruckdata', vars_table = 'db
             self._dbmodule = __import__('sqlite3') # note autocommit mode is off by default
             connect_kwargs = {
                 'detect_types': self._dbmodule.PARSE_DECLTYPES|self._dbmodule.PARSE_COLNAMES, 
-                'timeout': timeout
+                'timeout': timeout,
+                'cached_statements': self._sqlite_cached_statements
             }
             self.connection = self._dbmodule.connect(connect_details, **connect_kwargs)
+            if sqlite_wal:
+                self.connection.execute('PRAGMA journal_mode = WAL;')
+                self.connection.execute('PRAGMA synchronous = NORMAL;')
         if not self.connection:
             raise RuntimeError("Could not connect to database '%s'" % connect_details)
         if self.db_type == 'MYSQL':
@@ -148,31 +164,23 @@ def __init__(self, connect_details, data_table = 'dbtruckdata', vars_table = 'db
         else:
             self.cursor = self.connection.cursor()
         
+        self._dt_sep = 'T' if self._sqlite_t_sep else ' ' # separator used in datetime literals
         self._phchar = '%s' if self._dbmodule.paramstyle == 'pyformat' else '?' # place holder marker in prepared statements
+        self._server_version = None # tuple of ints - probed once on first use by server_version()
+        self._prep_cache = OrderedDict() # LRU map of repeated SQL -> prepared statement name (None if only seen once)
+        self._prep_count = 0 # used to generate unique prepared statement names
+        self._col_cache = {} # table name -> column_info() result, discarded whenever a table is altered or dropped
         
         self._json_str_output = json_str_output
         self._dates_str_output = dates_str_output
         self._bool_int_output = bool_int_output
             
-        if self.db_type == 'MYSQL':
-            self.connection.converter._json_str_output = self._json_str_output
-            self.connection.converter._dates_str_output = self._dates_str_output
-            self.connection.converter._bool_int_output = self._bool_int_output
-        elif self.db_type == 'SQLSERVER':
-            if self._bool_int_output is False:
-                self._cast_map.pop('boolint', None)
-            if self._dates_str_output is False:
-                self._cast_map.pop('isoformat', None)
-            if self._json_str_output is True:
-                self._cast_map.pop('json', None)
-                self._cast_map.pop('jsontuple', None)
-                self._cast_map.pop('jsonset', None)
-        else:
-            if self.db_type == 'SQLITE': # first remove two default converters in SQLite
-                self._dbmodule.register_converter('date', adapcast.convert_clear)
-                self._dbmodule.register_converter('timestamp', adapcast.convert_clear)
+        if self.db_type == 'SQLITE': # first remove two default converters in SQLite
+            self._dbmodule.register_converter('date', adapcast.convert_clear)
+            self._dbmodule.register_converter('timestamp', adapcast.convert_clear)
+        if self.db_type == 'SQLITE' or self.db_type == 'POSTGRESQL':
             self._register_adapters()
-            self._register_converters(alt=True)
+        self._apply_output_settings()
             
         self._check_or_create_vars_table() # includes an implicit commit
         
@@ -196,6 +204,22 @@ def type_from_uri(db_uri):
             db = 'SQLServer'
         return db
         
+    def server_version(self):
+        ' database server version as a tuple of integers e.g. (13, 0, 1601) - probed once per connection '
+        if self._server_version is None:
+            if self.db_type == 'POSTGRESQL':
+                v = self.connection.server_version # integer e.g. 90624 or 160002
+                version = (v // 10000, (v // 100) % 100, v % 100) if v < 100000 else (v // 10000, v % 10000)
+            elif self.db_type == 'MYSQL':
+                version = tuple(self.connection.get_server_version())
+            elif self.db_type == 'SQLSERVER':
+                rows = self._execute_rows("SELECT CAST(SERVERPROPERTY('ProductVersion') AS nvarchar(128));")
+                version = tuple(int(p) for p in text(rows[0][0]).split('.') if p.isdigit())
+            else:
+                version = self._dbmodule.sqlite_version_info
+            self._server_version = version
+        return self._server_version
+        
     def commit(self, implicit = False):
         'Commit database transactions.'
         #if self.db_type == 'SQLITE' and implicit: # skips wastefule explicit CREATE/ALTER/DROP TABLE commits for SQLite and mySQL
@@ -205,13 +229,49 @@ def commit(self, implicit = False):
     def rollback(self):
         'Rollback database transactions.'
         self.connection.rollback()
+        self._col_cache.clear() # any columns added in the transaction have gone
+        if any(self._prep_cache.values()): # and prepared statements may refer to them
+            self._stmt_cache_clear()
+            self.connection.rollback() # PREPARE is not transactional, so end the transaction DEALLOCATE opened
+        self._prep_cache.clear()
 
+    def reconfigure(self, json_str_output=None, dates_str_output=None, bool_int_output=None):
+        ' change any of the output settings supplied at initialization without reconnecting (None leaves a setting unchanged) '
+        if json_str_output is not None:
+            self._json_str_output = json_str_output
+        if dates_str_output is not None:
+            self._dates_str_output = dates_str_output
+        if bool_int_output is not None:
+            self._bool_int_output = bool_int_output
+        self._apply_output_settings()
+        
+    def _apply_output_settings(self): 
+        ' set up the output converters/casts to match the json_str_output, dates_str_output and bool_int_output settings '
+        if self.db_type == 'MYSQL':
+            self.connection.converter._json_str_output = self._json_str_output
+            self.connection.converter._dates_str_output = self._dates_str_output
+            self.connection.converter._bool_int_output = self._bool_int_output
+        elif self.db_type == 'SQLSERVER':
+            self._cast_map = dict(adapcast.SQLSERVER_CAST_MAP)
+            if self._bool_int_output is False:
+                self._cast_map.pop('boolint', None)
+            if self._dates_str_output is False:
+                self._cast_map.pop('isoformat', None)
+            if self._json_str_output is True:
+                self._cast_map.pop('json', None)
+                self._cast_map.pop('jsontuple', None)
+                self._cast_map.pop('jsonset', None)
+        else:
+            self._register_converters(alt=True)
+            
     def close(self):
+        self._prep_cache.clear() # prepared statements do not outlive the connection
         self.connection.close()
 
     def create_table(self, data, table_name=None, keys = [], error_if_exists=True): 
         'Create a table based on the data, but dont insert anything.'
         table_name = table_name if table_name else self._data_table
+        self._col_cache.pop(table_name, None) # columns are read fresh before deciding what to add (another connection may have added some)
         
         this_data = self._clean_data(data) # Turns it into a list of lists of (key, value) tuples (None values removed)
         if len(this_data) == 0 or len(this_data[0]) == 0:
@@ -381,6 +441,8 @@ def _create_col_match(self, obj): # obj should be an object recognised by an Ada
     def column_info(self, table_name=None): 
         ' dictionary of all columns keyed by name with the column type as the value'
         table_name = table_name if table_name else self._data_table
+        if table_name in self._col_cache:
+            return dict(self._col_cache[table_name])
         cols = {}
         if self.db_type == 'POSTGRESQL':
             sql = """SELECT column_name, data_type FROM information_schema.columns 
@@ -407,8 +469,19 @@ def column_info(self, table_name=None):
                 cols[text(row[1])] = text(row[2]).split()[0] # value is derived column type (before first space - see SQLite)
             if self._has_rowids:
                 cols[u'rowid'] = u'sequence integer'
+        if cols: # a missing table may be created later
+            self._col_cache[table_name] = dict(cols)
         return cols 
     
+    def refresh_schema(self, table_name=None):
+        ' discard cached column information for one table (or all tables if None) eg after changes made by another connection '
+        if table_name:
+            self._col_cache.pop(table_name, None)
+        else:
+            self._col_cache.clear()
+        self._stmt_cache_clear()
+        self.tables() # stores fresh _tables list
+        
     def columns(self, table_name=None):
         ' alphabetically ordered list of column names '
         table_name = table_name if table_name else self._data_table
@@ -489,8 +562,12 @@ def key_columns(self, table_name=None):
             rows = self._execute_rows(sql) 
             return [ text(row[1]) for row in rows if row[5] != 0 ]
             
+    def _fold_column(self, name): 
+        ' column names match regardless of case, except in PostgreSQL where iquote quotes any with capital letters '
+        return name if self.db_type == 'POSTGRESQL' else name.lower()
+        
     def _check_and_add_columns(self, table_name, data_row): 
-        columns = list(self.column_info(table_name).keys())
+        columns = [ self._fold_column(c) for c in self.column_info(table_name) ]
         # first check for explicit rowid column if required
         if self._has_rowids:
             if self.db_type == 'POSTGRESQL' and 'rowid' not in columns:
@@ -504,7 +581,7 @@ def _check_and_add_columns(self, table_name, data_row):
                     self._execute_norows(sql % self.iquote(table_name))
         exec_deferred = {}
         for key, value in data_row:
-            if key not in columns and value is not None:
+            if self._fold_column(key) not in columns and value is not None:
                 column_type = self._obj_column_type(value)
                 sqlsubs = (self.iquote(table_name), self.iquote(key), column_type) 
                 if self.db_type == 'SQLSERVER':
@@ -540,10 +617,16 @@ def execute(self, sql, *args, **kwargs):
         """ note executes a raw SQL statement - so must be quoted where necessary 
         and use appropriate place holders for the target DB """
         
+        if DDL_REGEX.match(sql):
+            self._schema_changed()
         rows = self._execute_rows(sql, *args)
 
         self._commit_if_default(kwargs)
 
+        return self._rows_to_dicts(rows)
+            
+    def _rows_to_dicts(self, rows):
+        ' convert the rows returned by the last statement to a list of OrderedDicts (or None if it was not a query) '
         if not self.cursor.description: # a list of tuples (first item is column name, aliased if necessary)
             return None
         else:
@@ -554,11 +637,20 @@ def execute(self, sql, *args, **kwargs):
     def _execute_norows(self, sql, *args):
         ' execute an SQL statement returning no data (apart from row count) and no commit either '
         #print(sql, args)
+        if DDL_REGEX.match(sql):
+            self._schema_changed()
         self.cursor.execute(sql, *args)
         if self.cursor.rowcount >= 0:
             return self.cursor.rowcount
         return None
         
+    def _execute_many(self, sql, seq_of_params):
+        ' execute an SQL statement once for each set of parameters returning no data (apart from total row count) and no commit either '
+        self.cursor.executemany(sql, seq_of_params)
+        if self.cursor.rowcount >= 0:
+            return self.cursor.rowcount
+        return None
+        
     def _execute_rows(self, sql, *args): 
         ' execute an SQl statement and return any result (no commit) '
         self.cursor.execute(sql, *args)
@@ -567,6 +659,58 @@ def _execute_rows(self, sql, *args):
         except self._dbmodule.ProgrammingError: # Postgres throws this if the fetchall() command produces no results 
             return []
             
+    def _execute_prepared_rows(self, sql, params): 
+        ' execute a frequently repeated SQL query and return any result (no commit) '
+        return self._execute_rows(self._prepared_sql(sql, len(params)), params)
+        
+    def _prepared_sql(self, sql, num_params, repeated=False): 
+        """ the SQL to run for a frequently repeated statement with num_params place holders 
+        In PostgreSQL a statement seen for the second time (or at once if repeated is set eg for executemany) 
+        is upgraded to a server side prepared statement (PREPARE once, EXECUTE many)
+        other databases just execute directly (SQLite already has its own internal statement cache) """
+        if self.db_type != 'POSTGRESQL':
+            return sql
+        if sql not in self._prep_cache and not repeated: # first sighting - just note it
+            self._prep_cache[sql] = None
+            self._trim_prep_cache()
+            return sql
+        self._prep_cache[sql] = name = self._prep_cache.get(sql)
+        self._prep_cache.move_to_end(sql)
+        if name is None:
+            self._prep_count += 1
+            name = 'dbtruck_prep_%d' % self._prep_count
+            pos = iter(range(1, num_params + 1))
+            psql = PYFORMAT_REGEX.sub(lambda m: '%' if m.group() == '%%' else '$%d' % next(pos), sql.rstrip().rstrip(';')) # positional $n place holders, unescaped %
+            self._execute_norows('SAVEPOINT dbtruck_prep;') # a failed PREPARE must not abort the current transaction
+            try:
+                self._execute_norows('PREPARE %s AS %s;' % (name, psql))
+                self._execute_norows('RELEASE SAVEPOINT dbtruck_prep;')
+            except self._dbmodule.Error: # eg parameter types that cannot be inferred - never try again
+                self._execute_norows('ROLLBACK TO SAVEPOINT dbtruck_prep;')
+                name = False
+            self._prep_cache[sql] = name
+            self._trim_prep_cache()
+        if name is False:
+            return sql
+        return 'EXECUTE %s (%s);' % (name, ', '.join([ self._phchar for i in range(num_params) ]))
+        
+    def _trim_prep_cache(self):
+        while len(self._prep_cache) > self._prep_cache_size: # evict least recently used
+            old_sql, old_name = self._prep_cache.popitem(last=False)
+            if old_name:
+                self._execute_norows('DEALLOCATE %s;' % old_name)
+                
+    def _schema_changed(self):
+        ' discard cached column information and prepared statements before a table is altered or dropped '
+        self._col_cache.clear()
+        self._stmt_cache_clear()
+        
+    def _stmt_cache_clear(self):
+        ' forget all prepared statements eg after a table has been altered or dropped '
+        if any(self._prep_cache.values()):
+            self._execute_norows('DEALLOCATE ALL;')
+        self._prep_cache.clear()
+            
     """def execute_query(self, sqlquery, data=[], **kwargs): no longer requuired
         if data is None:
             data = []
@@ -594,6 +738,21 @@ def _commit_if_default(self, kwargs):
     def dump(self, **kwargs): # alias for select
         return self.select(**kwargs)
         
+    def setup_script(self, sql): # implicit commit
+        """ execute a script of several SQL statements (no place holders) eg to set up tables in one call 
+        note MySQL scripts are split into statements at each semicolon """
+        self._schema_changed() # the script may alter or drop anything
+        if self.db_type == 'SQLITE':
+            self.connection.executescript(sql) # commits any pending transaction first
+        elif self.db_type == 'MYSQL':
+            for statement in sql.split(';'):
+                if statement.strip():
+                    self._execute_norows(statement + ';')
+        else:
+            self._execute_norows(sql) # multiple statements are accepted in one call
+        self.commit(implicit = True)
+        self.tables() # stores fresh _tables list
+        
     def vacuum(self): 
         if self.db_type == 'MYSQL':
             tlist = self._tables
@@ -633,6 +792,52 @@ def select(self, fields=None, table_name=None, conditions=None, params=[]):
                       dict of fields (with aliases as values) (can be an OrderedDict)
         output is always a list of OrderedDicts"""
         table_name = table_name if table_name else self._data_table
+        sql, params, rfield_column_map = self._select_sql(fields, table_name, conditions, params)
+        if params: # repeated parameterised queries can be prepared once and re-executed
+            result = self._rows_to_dicts(self._execute_prepared_rows(sql, params))
+        else:
+            result = self.execute(sql, params, commit = False)
+        #print('execute', result)
+        if result and self._cast_map: # post extraction output casting based on stored column comments
+            rowfield_castfunc_map = self._cast_functions(table_name, result[0].keys(), rfield_column_map)
+            if rowfield_castfunc_map:
+                for row in result:
+                    for rowfield, castfunc in rowfield_castfunc_map.items():
+                        row[rowfield] = castfunc(row[rowfield])
+        return result
+        
+    def select_columnar(self, fields=None, table_name=None, conditions=None, params=[]):
+        """ retrieve data as for select() but column-wise - the result is an OrderedDict of value lists keyed by field name
+        any post extraction output casting is applied once per column instead of to each row in turn """
+        table_name = table_name if table_name else self._data_table
+        sql, params, rfield_column_map = self._select_sql(fields, table_name, conditions, params)
+        rows = self._execute_prepared_rows(sql, params) if params else self._execute_rows(sql, params)
+        result = OrderedDict()
+        if not self.cursor.description:
+            return result
+        colnames = [ text(d[0]) for d in self.cursor.description ] 
+        columns = list(zip(*rows)) if rows else [ () for c in colnames ]
+        rowfield_castfunc_map = self._cast_functions(table_name, colnames, rfield_column_map) if rows and self._cast_map else {}
+        for rf, column in zip(colnames, columns):
+            castfunc = rowfield_castfunc_map.get(rf)
+            result[rf] = list(map(castfunc, column)) if castfunc else list(column)
+        return result
+        
+    def _cast_functions(self, table_name, result_fields, rfield_column_map):
+        ' map result field names to any post extraction output cast function, based on the stored column comments '
+        column_casttype_map = self._column_comments(table_name) # maps columns to cast type
+        #print(column_casttype_map)
+        rowfield_castfunc_map = {} # result field to function map
+        if column_casttype_map:
+            for rf in result_fields: # iterate over result field names
+                col = rfield_column_map[rf] if rfield_column_map else rf # get real table column name
+                cast_type = column_casttype_map.get(col) # match to any cast type stored in the comments
+                if cast_type and self._cast_map.get(cast_type): # only add if there is a matching function?
+                    rowfield_castfunc_map[rf] = self._cast_map[cast_type]
+        return rowfield_castfunc_map
+        
+    def _select_sql(self, fields, table_name, conditions, params):
+        ' build the SELECT statement used by select() - returns the SQL, the params list and the result field to column map '
         target = None
         if not fields: # catches empty lists and dicts
             target = '*, rowid' if self.db_type == 'SQLITE' and self._has_rowids else "*" # always include rowid in full list - implicit in Postgres/mySQL
@@ -664,25 +869,9 @@ def select(self, fields=None, table_name=None, conditions=None, params=[]):
         if conditions:
             if params:
                 conditions = self._sql_ph_check(conditions)
-            result = self.execute('SELECT %s FROM %s WHERE %s;' % (target, self.iquote(table_name), conditions), params, commit = False)
+            return 'SELECT %s FROM %s WHERE %s;' % (target, self.iquote(table_name), conditions), params, rfield_column_map
         else:
-            result = self.execute('SELECT %s FROM %s;' % (target, self.iquote(table_name)), [], commit = False)
-        #print('execute', result)
-        if result and self._cast_map: # post extraction output casting based on stored column comments
-            column_casttype_map = self._column_comments(table_name) # maps columns to cast type
-            #print(column_casttype_map)
-            if column_casttype_map:
-                rowfield_castfunc_map = {} # result field to function map
-                for rf in result[0].keys(): # iterate over result field names
-                    col = rfield_column_map[rf] if rfield_column_map else rf # get real table column name
-                    cast_type = column_casttype_map.get(col) # match to any cast type stored in the comments
-                    if cast_type and self._cast_map.get(cast_type): # only add if there is a matching function?
-                        rowfield_castfunc_map[rf] = self._cast_map[cast_type]
-                if rowfield_castfunc_map:
-                    for row in result:
-                        for rowfield, castfunc in rowfield_castfunc_map.items():
-                            row[rowfield] = castfunc(row[rowfield])
-        return result
+            return 'SELECT %s FROM %s;' % (target, self.iquote(table_name)), [], rfield_column_map
         
     def list_select(self, key_field, match_list, **kwargs):
         """ retrieve data from a datastore table where the key matches values in a list 
@@ -811,6 +1000,33 @@ def get_var(self, name, default=None):
         'Retrieve one saved variable from the database.'
         if not self._vars_table:
             return default
+        self._apply_var_output_settings()
+        data = self.select(table_name = self._vars_table, conditions = 'var_name = ?', params=name)
+        self._apply_output_settings() # restore
+        if not data or len(data) != 1:
+            return default
+        else:
+            value_col = data[0]['var_type'] 
+            return data[0][value_col]
+            #if value_col == self._var_table_col(adapcast.Pickle) and isinstance(rval, (bytes, bytearray, memoryview)): 
+            #    result = adapcast.convert_pickle(rval) # last resort unpickle if not done in select
+            #    return result
+            #else:
+            #    return rval
+
+    def get_vars(self, names, default=None): 
+        'Retrieve several saved variables from the database with one query - result is a dict keyed by name.'
+        names = list(names)
+        if not self._vars_table or not names:
+            return { n: default for n in names }
+        self._apply_var_output_settings()
+        data = self.list_select('var_name', names, table_name = self._vars_table)
+        self._apply_output_settings() # restore
+        stored = { d['var_name']: d[d['var_type']] for d in data } 
+        return { n: stored.get(n, default) for n in names }
+        
+    def _apply_var_output_settings(self): 
+        ' variables are always returned as their original Python types so the string and int output settings are suspended '
         if self.db_type == 'MYSQL':
             self.connection.converter._json_str_output = False
             self.connection.converter._dates_str_output = False
@@ -823,35 +1039,6 @@ def get_var(self, name, default=None):
             #self._json_string_converters(False)
             #self._dates_string_converters(False) 
             self._register_converters(alt=False)
-        data = self.select(table_name = self._vars_table, conditions = 'var_name = ?', params=name)
-        if self.db_type == 'MYSQL':
-            self.connection.converter._json_str_output = self._json_str_output
-            self.connection.converter._dates_str_output = self._dates_str_output
-            self.connection.converter._bool_int_output = self._bool_int_output
-        elif self.db_type == 'SQLSERVER':
-            self._cast_map = dict(adapcast.SQLSERVER_CAST_MAP)
-            if self._bool_int_output is False:
-                self._cast_map.pop('boolint', None)
-            if self._dates_str_output is False:
-                self._cast_map.pop('isoformat', None)
-            if self._json_str_output is True:
-                self._cast_map.pop('json', None)
-                self._cast_map.pop('jsontuple', None)
-                self._cast_map.pop('jsonset', None)
-        else:
-            #self._json_string_converters(self._json_str_output)
-            #self._dates_string_converters(self._dates_str_output)
-            self._register_converters(alt=True)
-        if not data or len(data) != 1:
-            return default
-        else:
-            value_col = data[0]['var_type'] 
-            return data[0][value_col]
-            #if value_col == self._var_table_col(adapcast.Pickle) and isinstance(rval, (bytes, bytearray, memoryview)): 
-            #    result = adapcast.convert_pickle(rval) # last resort unpickle if not done in select
-            #    return result
-            #else:
-            #    return rval
 
     def set_var(self, name, value, **kwargs):
         'Save one variable to the database - note a value of None deletes any existing entry'
@@ -882,9 +1069,39 @@ def set_var(self, name, value, **kwargs):
         self._execute_norows(sql, params)          
         self._commit_if_default(kwargs)
         
+    def set_vars(self, var_dict, **kwargs):
+        'Save several variables to the database - values of the same type are written with one executemany call (None deletes)'
+        if not self._vars_table:
+            raise RuntimeError('Variable storage disabled')
+        if not var_dict:
+            return
+        qtable = self.iquote(self._vars_table)
+        delete_sql = 'DELETE FROM %s WHERE var_name = %s;' % (qtable, self._phchar)
+        if self.db_type == 'POSTGRESQL' or self.db_type == 'SQLSERVER':
+            self._execute_many(delete_sql, [ [ name ] for name in var_dict ]) # replacements are a delete then an insert
+            insertcmd = 'INSERT'
+        else:
+            deletes = [ [ name ] for name, value in var_dict.items() if value is None ]
+            if deletes:
+                self._execute_many(delete_sql, deletes)
+            insertcmd = 'REPLACE' if self.db_type == 'MYSQL' else 'INSERT OR REPLACE'
+        by_type = OrderedDict() # var_type -> list of params
+        for name, value in var_dict.items():
+            if value is not None:
+                var_type = self._var_type(self._obj_type_label(value))
+                by_type.setdefault(var_type, []).append([name, var_type, self._obj_for_adapting(value)])
+        ph3 = '%s,%s,%s' % (self._phchar, self._phchar, self._phchar) # 3 place holders
+        for var_type, params_list in by_type.items():
+            sql = '%s INTO %s (var_name, var_type, %s) VALUES (%s);' % (insertcmd, qtable, self.iquote(var_type, force=True), ph3) 
+            self._execute_many(sql, params_list)
+        self._commit_if_default(kwargs)
+        
     def save_var(self, *args, **kwargs):
         self.set_var(*args, **kwargs)
         
+    def save_vars(self, *args, **kwargs):
+        self.set_vars(*args, **kwargs)
+        
     def all_vars(self, name):
         'Retrieve all saved variables from the database.'
         if not self._vars_table:
@@ -1004,62 +1221,69 @@ def insert(self, data, table_name=None, replace=False, create=False, **kwargs):
             row_total = 0
         
         try:
-            for row in this_data:
-                # row is a list of (key, value) tuples 
-                fields = [ self.iquote(pair[0]) for pair in row ] 
-                values = [ self._obj_for_adapting(pair[1]) for pair in row ] # wrap in Adapter class here if necessary
-                pholders = ','.join([self._phchar for f in fields]) # place holders
+            for field_set, group in groupby(this_data, key=lambda row: frozenset([ pair[0] for pair in row ])):
+                if not self._has_rowids and not (replace and table_keys): 
+                    # consecutive rows with the same fields (in any order) are inserted together using executemany
+                    row_dicts = [ dict(row) for row in group ]
+                    field_names = list(row_dicts[0].keys())
+                    fields = [ self.iquote(f) for f in field_names ] 
+                    values_list = [ [ self._obj_for_adapting(row[f]) for f in field_names ] for row in row_dicts ] # wrap in Adapter class here if necessary
+                    pholders = ','.join([self._phchar for f in fields]) # place holders
+                    sqlsubs = (insertcmd, self.iquote(table_name), ', '.join(fields), pholders)
+                    sql = '%s INTO %s (%s) VALUES (%s);' % sqlsubs
+                    count = self._execute_many(self._prepared_sql(sql, len(fields), repeated=len(values_list) > 1), values_list)
+                    row_total = row_total + len(values_list) if count is None else row_total + count
+                    continue
+                # rowids and replacements of keyed rows (PostgreSQL/SQL Server) are processed one row at a time
+                for row in group:
+                    # row is a list of (key, value) tuples 
+                    fields = [ self.iquote(pair[0]) for pair in row ] 
+                    values = [ self._obj_for_adapting(pair[1]) for pair in row ] # wrap in Adapter class here if necessary
+                    pholders = ','.join([self._phchar for f in fields]) # place holders
 
-                if self.db_type == 'POSTGRESQL' or self.db_type == 'SQLSERVER':
+                    if self.db_type == 'POSTGRESQL' or self.db_type == 'SQLSERVER':
                 
-                    if replace and table_keys: # delete any pre-existing row with the same keys
-                        row_keys = [ f[0] for f in row if f[0] in table_keys ]
-                        row_key_values = [ f[1] for f in row if f[0] in table_keys ]
-                        conditions = [ self.iquote(k) + ' = ' + self._phchar for k in row_keys ] 
-                        sqlsubs = (self.iquote(table_name), ' AND '.join(conditions))
-                        sql = 'DELETE FROM %s WHERE %s;' % sqlsubs
-                        self._execute_norows(sql, row_key_values)
+                        if replace and table_keys: # delete any pre-existing row with the same keys
+                            row_keys = [ f[0] for f in row if f[0] in table_keys ]
+                            row_key_values = [ f[1] for f in row if f[0] in table_keys ]
+                            conditions = [ self.iquote(k) + ' = ' + self._phchar for k in row_keys ] 
+                            sqlsubs = (self.iquote(table_name), ' AND '.join(conditions))
+                            sql = 'DELETE FROM %s WHERE %s;' % sqlsubs
+                            self._execute_norows(self._prepared_sql(sql, len(row_key_values)), row_key_values)
                 
-                    sqlsubs = (self.iquote(table_name), ', '.join(fields), pholders)
-                    if self._has_rowids:
-                        if self.db_type == 'POSTGRESQL':
-                            sql = 'INSERT INTO %s (%s) VALUES (%s) RETURNING rowid;' % sqlsubs
-                            self._execute_norows(sql, values) 
-                            rowid = self.cursor.fetchone()[0]
-                        elif self.db_type == 'SQLSERVER':
+                        sqlsubs = (self.iquote(table_name), ', '.join(fields), pholders)
+                        if self._has_rowids:
+                            if self.db_type == 'POSTGRESQL':
+                                sql = 'INSERT INTO %s (%s) VALUES (%s) RETURNING rowid;' % sqlsubs
+                                self._execute_norows(self._prepared_sql(sql, len(values)), values) 
+                                rowid = self.cursor.fetchone()[0]
+                            elif self.db_type == 'SQLSERVER':
+                                sql = 'INSERT INTO %s (%s) VALUES (%s);' % sqlsubs
+                                self._execute_norows(sql, values) 
+                                sql2 = 'SELECT ident_current(%s);' % self.iquote(table_name)
+                                rowid = self.cursor.execute(sql2).fetchone()[0] # NB direct cursor execute
+                        else:
                             sql = 'INSERT INTO %s (%s) VALUES (%s);' % sqlsubs
-                            self._execute_norows(sql, values) 
-                            sql2 = 'SELECT ident_current(%s);' % self.iquote(table_name)
-                            rowid = self.cursor.execute(sql2).fetchone()[0] # NB direct cursor execute
-                    else:
-                        sql = 'INSERT INTO %s (%s) VALUES (%s);' % sqlsubs
-                        count = self._execute_norows(sql, values)
-                        row_total = row_total if count is None else row_total + count
+                            count = self._execute_norows(self._prepared_sql(sql, len(values)), values)
+                            row_total = row_total if count is None else row_total + count
                 
-                else:
-                
-                    sqlsubs = (insertcmd, self.iquote(table_name), ', '.join(fields), pholders)
-                    sql = '%s INTO %s (%s) VALUES (%s);' % sqlsubs
-                    count = self._execute_norows(sql, values) 
-                    if self._has_rowids:
-                        rowid = self.cursor.lastrowid
-                        #rowid = self.cursor.execute('SELECT last_insert_rowid();').fetchone()[0] # NB direct cursor execute
                     else:
-                        row_total = row_total if count is None else row_total + count
+                
+                        sqlsubs = (insertcmd, self.iquote(table_name), ', '.join(fields), pholders)
+                        sql = '%s INTO %s (%s) VALUES (%s);' % sqlsubs
+                        count = self._execute_norows(sql, values) 
+                        if self._has_rowids:
+                            rowid = self.cursor.lastrowid
+                            #rowid = self.cursor.execute('SELECT last_insert_rowid();').fetchone()[0] # NB direct cursor execute
+                        else:
+                            row_total = row_total if count is None else row_total + count
                     
-                if self._has_rowids and rowid != 0:
-                    #print("data, rowid", fields, values, rowid)
-                    rowids.append(rowid)
+                    if self._has_rowids and rowid != 0:
+                        #print("data, rowid", fields, values, rowid)
+                        rowids.append(rowid)
             
         except self._dbmodule.Error as e:
-            etype = type(e).__name__
-            msg = str(e).split(':')
-            msg = msg[1] if self.db_type == 'SQLSERVER' else msg[0]
-            #print(etype, str(e), msg)
-            if (self.db_type == 'POSTGRESQL' and etype in [ 'UndefinedTable', 'UndefinedColumn']) or \
-               (self.db_type == 'MYSQL' and ("1146" in msg or "1054" in msg)) or \
-               (self.db_type == 'SQLITE' and ('no such table' in msg or 'no column named' in msg or 'no such column' in msg)) or \
-               (self.db_type == 'SQLSERVER' and ('Invalid object' in msg or 'Invalid column' in msg or 'Column not found' in msg)):
+            if self._missing_table_or_column(e):
                 #self.commit() # note this ends transaction + saves any data to other table not yet committed, before create/alter table which would lose data
                 self.rollback()
                 return self.insert(data=data, table_name=table_name, replace=replace, create=True, **kwargs) # start again
@@ -1074,12 +1298,89 @@ def insert(self, data, table_name=None, replace=False, create=False, **kwargs):
                 self._commit_if_default(kwargs)
             return row_total
 
+    def _missing_table_or_column(self, e): 
+        ' True if a database error was caused by a missing table or column (which can be fixed by create_table) '
+        etype = type(e).__name__
+        msg = str(e).split(':')
+        msg = msg[1] if self.db_type == 'SQLSERVER' else msg[0]
+        #print(etype, str(e), msg)
+        return (self.db_type == 'POSTGRESQL' and etype in [ 'UndefinedTable', 'UndefinedColumn']) or \
+               (self.db_type == 'MYSQL' and ("1146" in msg or "1054" in msg)) or \
+               (self.db_type == 'SQLITE' and ('no such table' in msg or 'no column named' in msg or 'no such column' in msg)) or \
+               (self.db_type == 'SQLSERVER' and ('Invalid object' in msg or 'Invalid column' in msg or 'Column not found' in msg))
+
     def upsert(self, *args, **kwargs): # included for compatibility only - not a real upsert see above
         return self.insert(replace=True, *args, **kwargs)
         
     def save(self, *args, **kwargs): # actually an insert or replace operation
         return self.insert(replace=True, *args, **kwargs)
         
+    def save_columnar(self, headers, columns, table_name=None, replace=True, create=False, **kwargs): 
+        """ insert or replace data supplied column-wise - headers is a list of field names and columns a matching list of value lists
+        all the rows are written with a single executemany call (None values are stored as NULL = full row replace as in insert) 
+        as in insert the table is only created/altered (with an implicit commit) if it or any of the columns are missing """
+        table_name = table_name if table_name else self._data_table
+        if len(columns) != len(headers) or any(len(col) != len(columns[0]) for col in columns):
+            raise ValueError('save_columnar needs one column per header and all the columns must have the same length.')
+        if not columns or not columns[0]:
+            return [] if self._has_rowids else 0
+        if self._has_rowids: # executemany cannot return the rowid of each row
+            return self.insert([ OrderedDict(zip(headers, row)) for row in zip(*columns) ], table_name=table_name, replace=replace, **kwargs)
+            
+        sample = OrderedDict() # first non-null value in each column
+        for h, col in zip(headers, columns):
+            sample[h] = next((v for v in col if v is not None), None)
+        keep = [ i for i, h in enumerate(headers) if sample[h] is not None ] # all null columns are left as NULL
+        if not keep:
+            raise ValueError('No data sample values, or all the values were null.')
+        if create or table_name not in self._tables or \
+                not { self._fold_column(headers[i]) for i in keep } <= { self._fold_column(c) for c in self.column_info(table_name) }: 
+            self.create_table(table_name=table_name, data=sample, error_if_exists=False) # creates table and/or adds any missing columns
+        
+        fields = [ self.iquote(headers[i]) for i in keep ]
+        rows = list(zip(*[ list(map(self._obj_for_adapting, columns[i])) for i in keep ])) # wrap in Adapter class here if necessary
+        qtable = self.iquote(table_name)
+        insertcmd = 'INSERT'
+        try:
+            if replace:
+                if self.db_type == 'SQLITE':
+                    insertcmd = 'INSERT OR REPLACE'
+                elif self.db_type == 'MYSQL':
+                    insertcmd = 'REPLACE'
+                else: # delete any pre-existing rows with the same keys
+                    table_keys = self.key_columns(table_name)
+                    kpos = [ n for n, i in enumerate(keep) if headers[i] in table_keys ]
+                    if table_keys and kpos:
+                        last_rows = {} # key values -> position of the last row with them (the last duplicate wins as in insert)
+                        for r, key_values in enumerate(zip(*[ columns[keep[n]] for n in kpos ])):
+                            last_rows[key_values] = r
+                        if len(last_rows) < len(rows): # a repeated key would break the primary key on the second insert
+                            rows = [ rows[r] for r in sorted(last_rows.values()) ]
+                        conditions = [ fields[n] + ' = ' + self._phchar for n in kpos ] 
+                        sql = 'DELETE FROM %s WHERE %s;' % (qtable, ' AND '.join(conditions))
+                        self._execute_many(self._prepared_sql(sql, len(kpos), repeated=True), [ [ row[n] for n in kpos ] for row in rows ])
+            sql = '%s INTO %s (%s) VALUES (%s);' % (insertcmd, qtable, ', '.join(fields), ','.join([ self._phchar for f in fields ]))
+            count = self._execute_many(self._prepared_sql(sql, len(fields), repeated=len(rows) > 1), rows)
+        except self._dbmodule.Error as e:
+            if not create and self._missing_table_or_column(e): # eg dropped or altered by another connection
+                self.rollback()
+                return self.save_columnar(headers, columns, table_name=table_name, replace=replace, create=True, **kwargs) # start again
+            raise
+        self._commit_if_default(kwargs)
+        return len(rows) if count is None else count
+        
+    def save_many(self, data, table_name=None, replace=True, **kwargs): 
+        """ insert or replace a list of dicts which all have the same keys (None values are stored as NULL)
+        the rows are passed to save_columnar so they are written with a single executemany call """
+        if not data:
+            return [] if self._has_rowids else 0
+        headers = list(data[0].keys())
+        key_set = set(headers)
+        if any(set(row.keys()) != key_set for row in data):
+            raise ValueError('All the rows passed to save_many must have the same keys.')
+        columns = [ [ row[h] for row in data ] for h in headers ]
+        return self.save_columnar(headers, columns, table_name=table_name, replace=replace, **kwargs)
+        
     def delete(self, conditions, table_name=None, params=[], **kwargs):
         """ delete rows from the table in the datastore where conditions apply
         delete without conditions not allowed - but you can force wholesale delete by supplying an always true condition like '1=1' """
@@ -1143,13 +1444,16 @@ def create_index(self, columns, table_name=None, unique=False, error_if_exists=T
         table_name = table_name if table_name else self._data_table
         index_name = simplify(table_name) + '_' + '_'.join(map(simplify, columns))
         index_cmd = 'CREATE UNIQUE INDEX' if unique else 'CREATE INDEX'
+        qtable = self.iquote(table_name)
+        qindex = self.iquote(index_name)
+        qcolumns = ', '.join(map(self.iquote, columns))
         if self.db_type == 'SQLSERVER' or self.db_type == 'MYSQL': # in these two dbs text column indexes have to be fixed width type
             all_columns = self.column_info(table_name)
             for col, col_type in all_columns.items():
                 new_col_type = self._index_col_type(col_type)
                 #print(col_type, new_col_type)
                 if new_col_type != col_type:
-                    sqlsubs = (self.iquote(table_name), self.iquote(col), new_col_type) 
+                    sqlsubs = (qtable, self.iquote(col), new_col_type) 
                     sql = 'ALTER TABLE %s MODIFY COLUMN %s %s;' if self.db_type == 'MYSQL' else 'ALTER TABLE %s ALTER COLUMN %s %s;'
                     #print(sql % sqlsubs)
                     self._execute_norows(sql % sqlsubs)
@@ -1157,14 +1461,14 @@ def create_index(self, columns, table_name=None, unique=False, error_if_exists=T
         if (self.db_type == 'MYSQL' or self.db_type == 'SQLSERVER') and error_if_exists:
             indices = self.indices(table_name)
             if index_name not in indices:
-                sql = '%s %s ON %s (%s);' % (index_cmd, self.iquote(index_name), self.iquote(table_name), ', '.join(map(self.iquote, columns)))
+                sql = '%s %s ON %s (%s);' % (index_cmd, qindex, qtable, qcolumns)
                 #print(sql)
                 self._execute_norows(sql)
             else:
                 return index_name
         else:
             index_cmd = index_cmd if error_if_exists else index_cmd + ' IF NOT EXISTS'
-            sql = '%s %s ON %s (%s);' % (index_cmd, self.iquote(index_name), self.iquote(table_name), ', '.join(map(self.iquote, columns)))
+            sql = '%s %s ON %s (%s);' % (index_cmd, qindex, qtable, qcolumns)
             #print(sql)
             self._execute_norows(sql) 
         self.commit(implicit = True)
@@ -1182,6 +1486,10 @@ def drop_index(self, index_name, table_name=None, if_exists=False): # implicit c
                 sql = '%s %s ON %s;' % (index_cmd, self.iquote(index_name), self.iquote(table_name))
                 #print(sql)
                 self._execute_norows(sql)
+            elif self.db_type == 'SQLSERVER' and self.server_version() >= (13,): # native syntax from SQL Server 2016
+                sql = '%s IF EXISTS %s ON %s;' % (index_cmd, self.iquote(index_name), self.iquote(table_name))
+                #print(sql)
+                self._execute_norows(sql)
             else:
                 index_cmd = '%s %s ON %s;' % (index_cmd, self.iquote(index_name), self.iquote(table_name))
                 if self.db_type == 'MYSQL':
@@ -1208,7 +1516,7 @@ def indices(self, table_name=None):
             sql = """SELECT i.name as name FROM sys.indexes i INNER JOIN sys.tables AS t ON i.object_id = t.object_id WHERE i.name is not null and t.name = %s ORDER BY i.name;""" % self._phchar
         else:
             sql = """SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s ORDER BY name;""" % self._phchar
-        rows = self._execute_rows(sql, [table_name])
+        rows = self._execute_prepared_rows(sql, [table_name])
         #print (rows)
         return sorted([ text(row[0]) for row in rows ])
         
@@ -1243,8 +1551,19 @@ def _cast_data_to_column_type(self, data):
             except ValueError:
               raise TypeError(u"Data could not be converted to match the existing '%s' column type." % type(key))"""
               
-    def dump_to(self, file_name, **kwargs):
+    def dump_to(self, file_name, server_copy=False, **kwargs):
         ' dump a table to a csv file '
+        # server_copy=True (PostgreSQL only) streams the CSV directly from the server using COPY which is much faster for large tables,
+        # but the output uses standard CSV quoting and no post extraction casts, so is not suitable for reloading with load_from
+        if server_copy and self.db_type == 'POSTGRESQL':
+            sql, params, rfield_column_map = self._select_sql(kwargs.get('fields'), kwargs.get('table_name') or self._data_table,
+                kwargs.get('conditions'), kwargs.get('params', []))
+            sql = 'COPY (' + sql.rstrip(';') + ') TO STDOUT WITH CSV HEADER'
+            if params:
+                sql = self.cursor.mogrify(sql, params).decode(self._dbmodule.extensions.encodings[self.connection.encoding]) # binds any place holders client side
+            with open(file_name, 'w', newline='') as f:
+                self.cursor.copy_expert(sql, f)
+            return
         with open(file_name, 'w') as f:
             result = self.select(**kwargs) 
             if result:
@@ -1258,24 +1577,24 @@ def load_from(self, file_name, **kwargs):
         with open(file_name, 'r') as f:
             reader = csv.reader(f, quoting=csv.QUOTE_NONNUMERIC) # note this format assumes the only unquoted fields are numeric values
             headers = next(reader) 
-            data = []
-            for row in reader:
-                new_row = []
-                for v in row:
-                    if isinstance(v, str) and v == '':
-                        new_row.append(None)
-                    elif isinstance(v, float) and v.is_integer():
-                        new_row.append(int(v))
-                    else: 
-                        new_row.append(v)
-                data.append(OrderedDict(list(zip(headers, new_row))))
-            if data:
-                self.save(data=data, **kwargs)
+            width = len(headers)
+            sample = list(islice(reader, 100))
+            convert_row = csv_row_converter(sample, width) # specialised on the column types in the first 100 rows
+            rows = []
+            for row in chain(sample, reader):
+                if len(row) < width:
+                    row.extend([ '' ] * (width - len(row))) # short rows are padded with nulls
+                rows.append(convert_row(row))
+            if rows:
+                columns = [ list(col) for col in zip(*rows) ] 
+                self.save_columnar(headers=headers, columns=columns, **kwargs)
                 
     def sql_dt(self, this_dt): 
         # returns quoted literal or quoted identifier suitable for insertion into SQL for a date
         # if this_dt is null, returns the current date
-        poss_date = ISODate.cast(this_dt)
+        if isinstance(this_dt, date): # date or datetime object - no string matching needed
+            return self.nquote((this_dt.date() if isinstance(this_dt, datetime) else this_dt).isoformat())
+        poss_date = ISODate.cast(this_dt) if not isinstance(this_dt, str) or len(this_dt) == 10 else None # date strings are always 10 chars
         if poss_date:
             return self.nquote(poss_date) # its a literal
         poss_datetime = ISODateTime.cast(this_dt)
@@ -1295,7 +1614,13 @@ def sql_dt(self, this_dt):
     def sql_dtm(self, this_dtm): 
         # returns quoted literal or quoted identifier suitable for insertion into SQL for a datetime
         # if this_dtm is null, returns the current datetime
-        if getattr(self, '_sqlite_t_sep', False):
+        if isinstance(this_dtm, datetime): # no string matching needed
+            return self.nquote(this_dtm.isoformat(self._dt_sep))
+        elif isinstance(this_dtm, date):
+            return self.nquote(this_dtm.isoformat() + self._dt_sep + '00:00:00')
+        if isinstance(this_dtm, str) and len(this_dtm) == 10: # too short for a datetime string
+            poss_datetime = None
+        elif self._sqlite_t_sep:
             poss_datetime = ISODateTTime.cast(this_dtm) # use 'T' date time separator
         else:
             poss_datetime = ISODateTime.cast(this_dtm) # use space date time separator by default
@@ -1303,10 +1628,7 @@ def sql_dtm(self, this_dtm):
             return self.nquote(poss_datetime) # it's a literal
         poss_date = ISODate.cast(this_dtm)
         if poss_date:
-            if getattr(self, '_sqlite_t_sep', False):
-                return self.nquote(poss_date + 'T' + '00:00:00') # its a literal
-            else:
-                return self.nquote(poss_date + ' ' + '00:00:00') # its a literal
+            return self.nquote(poss_date + self._dt_sep + '00:00:00') # its a literal
         if this_dtm: # its an identfier
             return self.iquote(this_dtm)
         if self.db_type == 'MYSQL':
@@ -2,6 +2,8 @@
 from datetime import datetime, date, time
 import time as timetime
 import os
+import csv
+import tempfile
 from math import floor
 
 from dbtruck import Store, Pickle, ISODate, ISODateTime
@@ -10,86 +12,171 @@
 
 import test_settings as settings
 
+_SCHEME = Store.type_from_uri(settings.CONNECT_STRING).upper() # same values as Store.db_type e.g. 'SQLITE' or 'POSTGRESQL'
+_DIR_READY = set() # SQLite test folders already created
+
 def connect_string(testname):
     use_rowids = settings.USE_ROWIDS
     t_sep = settings.SQLITE_T_SEPARATOR
     connect_s = settings.CONNECT_STRING
-    if connect_s.startswith('mysql://') or connect_s.startswith('postgresql://') \
-            or connect_s.startswith('postgres://') or ';' in connect_s:
-        return connect_s, t_sep, use_rowids
-    os.makedirs(connect_s, exist_ok=True)
-    dbfile = connect_s+os.sep+testname+'.sqlite'
-    if os.path.exists(dbfile): 
-        os.remove(dbfile)
-    return dbfile, t_sep, use_rowids
+    if _SCHEME != 'SQLITE': # server databases are not reset
+        return connect_s, t_sep, use_rowids, False
+    if settings.SQLITE_IN_MEMORY:
+        return ':memory:', t_sep, use_rowids, True
+    if connect_s not in _DIR_READY:
+        os.makedirs(connect_s, exist_ok=True)
+        _DIR_READY.add(connect_s)
+    worker = os.environ.get('PYTEST_XDIST_WORKER') # eg 'gw0' when run in parallel with 'pytest -n auto'
+    dbfile = os.path.join(connect_s, testname + ('_' + worker if worker else '') + '.sqlite')
+    for f in (dbfile, dbfile + '-wal', dbfile + '-shm'): # including any write-ahead log files
+        try:
+            os.unlink(f)
+        except FileNotFoundError:
+            pass
+    return dbfile, t_sep, use_rowids, True # last element is True if the database is newly created (empty)
 
 class TestClass(object):
     avalue = 10
+    
+WEIRD_THING = { 'blan': None, 1: 2, False: 'true' }
+PICKLED = Pickle(WEIRD_THING)
+JSON_OBJ = { 'uni': u'123 \u0115\u00f8C', 'data': 999.99, 'default': 'def' } # e caron + degree
+TEST_OBJ = TestClass() # one instance shared by all tests
+LONG_STRING = '\n            '.join([ 'x' * 108 ] * 7) # about 800 characters over several indented lines
+
+def _build_mydata(): # read only objects are shared, only the dates and times are fresh
+    now = datetime.now() # one clock reading so the date, datetime and time values agree
+    return {
+        'uid': 'xxx',
+        'atrue': True,
+        'afalse': False,
+        'number': 999,
+        'floating': 0.346,
+        'somebytes': b'xaxy',
+        'unicode': u'blingblangy\u00e9\u00f8C', # e acute + degree
+        'atuple': ( 1, 2, 3 ),
+        'aset': { 1, '2', 3.6 },
+        'adate': now.date(),
+        'adatetime': now,
+        'atime': now.time(),
+        'jsonobj': JSON_OBJ,
+        'anobj': TEST_OBJ,
+        'strdt': '1987-12-11',
+        'strdtm': '1987-12-11T00:00:01.3',
+        'strtm': '14:07:01.345678',
+        'pickled': PICKLED,
+        'longstring': LONG_STRING,
+        }
+    
+STORED_TYPES = [ # (field, expected type, failure message) for data retrieved with default output settings
+    ('uid', str, 'Not preserving string data'),
+    ('atrue', bool, 'Not preserving boolean data'),
+    ('number', int, 'Not preserving integer data'),
+    ('floating', float, 'Not preserving float data'),
+    ('somebytes', bytes, 'Not preserving bytes data'),
+    ('unicode', str, 'Not preserving unicode data'),
+    ('adate', date, 'Not preserving date data'),
+    ('adatetime', datetime, 'Not preserving datetime data'),
+    ('atime', time, 'Not preserving time data'),
+    ('jsonobj', dict, 'Not preserving json data'),
+    ('strdt', date, 'Not preserving string date data'),
+    ('strdtm', datetime, 'Not preserving string datetime data'),
+    ('strtm', time, 'Not preserving string time data'),
+    #('intts', int, 'Not preserving integer unix epoch data'),
+    ('aset', set, 'Not preserving set data'),
+    ('atuple', tuple, 'Not preserving tuple data'),
+    ('anobj', TestClass, 'Not preserving object data'),
+    ('pickled', dict, 'Not preserving pickled objects'),
+    ('longstring', str, 'Not preserving long strings type'),
+]
+
+STRING_OUTPUT_TYPES = [ # (field, expected type, failure message) for data retrieved with json/dates string output
+    ('uid', str, 'Not preserving string data'),
+    ('number', int, 'Not preserving integer data'),
+    ('floating', float, 'Not preserving float data'),
+    ('somebytes', bytes, 'Not preserving bytes data'),
+    ('unicode', str, 'Not preserving unicode data'),
+    ('atuple', str, 'Not converting tuple data to dump unicode string'),
+    ('jsonobj', str, 'Not converting json data to dump unicode string'),
+    ('anobj', TestClass, 'Not preserving object data'),
+    ('pickled', dict, 'Not preserving pickled objects'),
+    ('longstring', str, 'Not preserving long strings'),
+    ('adate', str, 'Not converting date data to string'),
+    ('adatetime', str, 'Not converting datetime data to string'),
+    ('atime', str, 'Not converting time data to string'),
+    ('strdt', str, 'Not preserving string date data'),
+    ('strdtm', str, 'Not preserving string datetime data'),
+    ('strtm', str, 'Not preserving string time data'),
+]
+
+BOOLEAN_CASES = [ # (conditions, expected row count, failure message) - implicit true/false tests
+    ('atrue', 1, 'Failed to select boolean true as true'),
+    ('not atrue', 0, 'Failed to ignore boolean true as not true'),
+    ('not afalse', 1, 'Failed to select boolean false as not true'),
+    ('afalse', 0, 'Failed to ignore boolean false as true'),
+    ('anull', 0, 'Failed to ignore null with implicit boolean true'),
+    ('not anull', 0, 'Failed to ignore null with implicit boolean false'),
+]
+
+SQLSERVER_BOOLEAN_CASES = [ # SQL Server has no implicit true/false so test against 1 and 0
+    ('atrue=1', 1, 'Failed to select boolean true as 1'),
+    ('atrue=0', 0, 'Failed to ignore boolean true as 0'),
+    ('afalse=0', 1, 'Failed to select boolean false as 0'),
+    ('afalse=1', 0, 'Failed to ignore boolean false as 1'),
+    ('anull=1', 0, 'Failed to ignore null with =1 boolean test'),
+    ('anull=0', 0, 'Failed to ignore null with =0 boolean test'),
+]
 
 class DBTruckTests(unittest.TestCase):
 
+    @classmethod
+    def setUpClass(cls): # one connection shared by all tests - each test uses its own table names
+        cls._connect, cls._t_sep, cls._use_rowids, cls._fresh_db = connect_string(cls.__name__)
+        cls._store = Store(cls._connect, sqlite_t_sep=cls._t_sep, has_rowids = cls._use_rowids, sqlite_wal = settings.SQLITE_WAL)
+        if cls._store.db_type == 'SQLITE':
+            pragmas = [] 
+            if settings.SQLITE_NO_SYNC:
+                pragmas.extend([ 'PRAGMA synchronous = OFF;', 'PRAGMA temp_store = MEMORY;' ])
+            if settings.SQLITE_EXCLUSIVE: # no other connection uses the test database
+                pragmas.append('PRAGMA locking_mode = EXCLUSIVE;')
+            if pragmas:
+                cls._store.setup_script(' '.join(pragmas))
+        
+    def tearDown(self): # anything left uncommitted by a failed test is not seen by the next one
+        self._store.rollback()
+        
+    @classmethod
+    def tearDownClass(cls):
+        cls._store.close()
+        
+    def assert_exact_type(self, v, t, msg): # subclasses do not match
+        if type(v) is not t:
+            self.fail('%s (%s)' % (msg, type(v).__name__))
+            
+    def check_types(self, r, expected): # date and datetime are checked with isinstance - datetime is a subclass of date
+        for k, t, msg in expected:
+            if t is date or t is datetime:
+                self.assertIsInstance(r[k], t, msg)
+            else:
+                self.assert_exact_type(r[k], t, msg)
+
     def test_store_data(self):  
 
-        weird_thing = { 'blan': None, 1: 2, False: 'true' }
-    
-        mydata = {
-            'uid': 'xxx',
-            'atrue': True,
-            'afalse': False,
-            'number': 999,
-            'floating': 0.346,
-            'somebytes': b'xaxy',
-            'unicode': u'blingblangy\u00e9\u00f8C', # e acute + degree
-            'atuple': ( 1, 2, 3 ),
-            'aset': { 1, '2', 3.6 },
-            'adate': date.today(),
-            'adatetime': datetime.now(),
-            'atime': datetime.now().time(),
-            'jsonobj': { 'uni': u'123 \u0115\u00f8C', 'data': 999.99, 'default': 'def' }, # e caron + degree
-            'anobj': TestClass(),
-            'strdt': '1987-12-11',
-            'strdtm': '1987-12-11T00:00:01.3',
-            'strtm': '14:07:01.345678',
-            'pickled': Pickle(weird_thing),
-            'longstring': """xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
-            xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
-            xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
-            xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
-            xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
-            xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
-            xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx""",
-            }
+        mydata = _build_mydata()
         
         
-        connect, t_sep, use_rowids = connect_string(self._testMethodName)
-        teststore = Store(connect, sqlite_t_sep=t_sep, has_rowids = use_rowids)
+        t_sep = self._t_sep
+        teststore = self._store
         dbtable = self._testMethodName + '_1'
-        teststore.drop(dbtable, if_exists=True)
+        if not self._fresh_db: # tables only survive from earlier runs on server databases
+            teststore.drop(dbtable, if_exists=True)
         teststore.create(table_name=dbtable, data=mydata )
         applics = [ mydata ]  
         teststore.save( data=applics, table_name=dbtable, commit=True)
         retrieved = teststore.select(table_name=dbtable) 
         r = retrieved[0]
         #print(r)
-        self.assertIsInstance(r['uid'], str, 'Not preserving string data')
-        self.assertIsInstance(r['atrue'], bool, 'Not preserving boolean data')
-        self.assertIsInstance(r['number'], int, 'Not preserving integer data')
-        self.assertIsInstance(r['floating'], float, 'Not preserving float data')
-        self.assertIsInstance(r['somebytes'], bytes, 'Not preserving bytes data')
-        self.assertIsInstance(r['unicode'], str, 'Not preserving unicode data')
-        self.assertIsInstance(r['adate'], date, 'Not preserving date data')
-        self.assertIsInstance(r['adatetime'], datetime, 'Not preserving datetime data')
-        self.assertIsInstance(r['atime'], time, 'Not preserving time data')
-        self.assertIsInstance(r['jsonobj'], dict, 'Not preserving json data')
-        self.assertIsInstance(r['strdt'], date, 'Not preserving string date data')
-        self.assertIsInstance(r['strdtm'], datetime, 'Not preserving string datetime data')
-        self.assertIsInstance(r['strtm'], time, 'Not preserving string time data')
-        #self.assertIsInstance(r['intts'], int, 'Not preserving integer unix epoch data')
-        self.assertIsInstance(r['aset'], set, 'Not preserving set data')
-        self.assertIsInstance(r['atuple'], tuple, 'Not preserving tuple data')
-        self.assertIsInstance(r['anobj'], TestClass, 'Not preserving object data')
-        self.assertIsInstance(r['pickled'], dict, 'Not preserving pickled objects')
-        self.assertIsInstance(r['longstring'], str, 'Not preserving long strings type')
+        self.check_types(r, STORED_TYPES)
         
         self.assertEqual(r['longstring'], mydata['longstring'], 'Not preserving long strings')
         
@@ -100,72 +187,61 @@ def test_store_data(self):
         #retrieved2 = teststore.select(table_name=dbtable, fields='adatetime::text as ts') # note default has space separater not 'T'
         #self.assertIsInstance(retrieved2[0]['ts'], str, 'Not casting dates to ISO')
         
-        #Placeholders and conditions for booleans
-        conditions = 'atrue = ?'; params = [ True ]
-        retrieved = teststore.select(table_name=dbtable, conditions=conditions, params=params) 
-        self.assertIsInstance(retrieved[0]['atrue'], bool, 'Boolean true placeholder not correct instance')
-        self.assertEqual(retrieved[0]['atrue'], True, 'Boolean true placeholder not working')
-        conditions = 'afalse = ?'; params = [ False ]
-        retrieved = teststore.select(table_name=dbtable, conditions=conditions, params=params) 
-        self.assertIsInstance(retrieved[0]['afalse'], bool, 'Boolean false placeholder not correct instance')
-        self.assertEqual(retrieved[0]['afalse'], False, 'Boolean false placeholder not working')
-        
-        #Placeholders and conditions for dates + datetimes
-        conditions = 'adate = ?'; params = [ mydata['adate'] ]
-        retrieved = teststore.select(table_name=dbtable, conditions=conditions, params=params) 
-        self.assertIsInstance(retrieved[0]['adate'], date, 'Date placeholder not correct instance')
-        self.assertEqual(retrieved[0]['adate'], mydata['adate'], 'Date placeholder not working')
-        conditions = 'adate = ?'; params = [ mydata['adate'].isoformat() ]
-        retrieved = teststore.select(table_name=dbtable, conditions=conditions, params=params) 
-        self.assertIsInstance(retrieved[0]['adate'], date, 'ISO Date placeholder not correct instance')
-        self.assertEqual(retrieved[0]['adate'], mydata['adate'], 'ISO Date placeholder not working')
-        
-        conditions = 'adatetime = ?'; params = [ mydata['adatetime'] ]
-        retrieved = teststore.select(table_name=dbtable, conditions=conditions, params=params) 
-        self.assertIsInstance(retrieved[0]['adatetime'], datetime, 'Datetime placeholder not correct instance')
-        self.assertEqual(retrieved[0]['adatetime'], mydata['adatetime'], 'Datetime placeholder not working')
-        if t_sep:
-            conditions = 'adatetime = ?'; params = [ mydata['adatetime'].isoformat('T') ] # note T separator
-        else:
-            conditions = 'adatetime = ?'; params = [ mydata['adatetime'].isoformat(' ') ] # note space separator
-        retrieved = teststore.select(table_name=dbtable, conditions=conditions, params=params) 
-        self.assertIsInstance(retrieved[0]['adatetime'], datetime, 'ISO Datetime placeholder not correct instance')
-        self.assertEqual(retrieved[0]['adatetime'], mydata['adatetime'], 'ISO Datetime placeholder not working')
+        #Placeholders and conditions for booleans, dates + datetimes
+        iso_adate = mydata['adate'].isoformat()
+        iso_adatetime = mydata['adatetime'].isoformat('T' if t_sep else ' ') # note separator must match storage format
+        placeholder_cases = [ # (field, parameter, expected value, expected type, failure message prefix)
+            ('atrue', True, True, bool, 'Boolean true placeholder'),
+            ('afalse', False, False, bool, 'Boolean false placeholder'),
+            ('adate', mydata['adate'], mydata['adate'], date, 'Date placeholder'),
+            ('adate', iso_adate, mydata['adate'], date, 'ISO Date placeholder'),
+            ('adatetime', mydata['adatetime'], mydata['adatetime'], datetime, 'Datetime placeholder'),
+            ('adatetime', iso_adatetime, mydata['adatetime'], datetime, 'ISO Datetime placeholder'),
+        ]
+        for field, param, expected, etype, msg in placeholder_cases:
+            with self.subTest(msg):
+                retrieved = teststore.select(table_name=dbtable, conditions=field + ' = ?', params=[ param ]) 
+                self.assertIsInstance(retrieved[0][field], etype, msg + ' not correct instance')
+                self.assertEqual(retrieved[0][field], expected, msg + ' not working')
         
         #self.assertIsInstance(r['adate'], date, 'Not retrieving date data')
         #self.assertIsInstance(r['adatetime'], datetime, 'Not retrieving datetime data')
         #self.assertIsInstance(r['atime'], time, 'Not retrieving time data')
         
-        teststore.close()
-        
-        teststore = Store(connect, json_str_output = True, dates_str_output = True, bool_int_output = True, sqlite_t_sep=t_sep, has_rowids = use_rowids)
+        teststore.reconfigure(json_str_output = True, dates_str_output = True, bool_int_output = True)
+        self.addCleanup(teststore.reconfigure, json_str_output = False, dates_str_output = False, bool_int_output = False)
         dbtable = self._testMethodName + '_2'
-        teststore.drop(dbtable, if_exists=True)
+        if not self._fresh_db:
+            teststore.drop(dbtable, if_exists=True)
         teststore.create(table_name=dbtable, data=mydata)
         applics = [ mydata ]  
         teststore.save( data=applics, table_name=dbtable, commit=True)
         retrieved = teststore.select(table_name=dbtable) 
         r = retrieved[0]
-        self.assertIsInstance(r['uid'], str, 'Not preserving string data')
+        self.check_types(r, STRING_OUTPUT_TYPES)
         self.assertNotIsInstance(r['atrue'], bool, 'Not converting boolean data to integer') # note boolean is int so isinstance(int) does not work
-        self.assertIsInstance(r['number'], int, 'Not preserving integer data') 
-        self.assertIsInstance(r['floating'], float, 'Not preserving float data')
-        self.assertIsInstance(r['somebytes'], bytes, 'Not preserving bytes data')
-        self.assertIsInstance(r['unicode'], str, 'Not preserving unicode data')
-        self.assertIsInstance(r['atuple'], str, 'Not converting tuple data to dump unicode string')
-        self.assertIsInstance(r['jsonobj'], str, 'Not converting json data to dump unicode string')
-        self.assertIsInstance(r['anobj'], TestClass, 'Not preserving object data')
-        self.assertIsInstance(r['pickled'], dict, 'Not preserving pickled objects')
-        self.assertIsInstance(r['longstring'], str, 'Not preserving long strings')
-        self.assertIsInstance(r['adate'], str, 'Not converting date data to string')
-        self.assertIsInstance(r['adatetime'], str, 'Not converting datetime data to string')
-        self.assertIsInstance(r['atime'], str, 'Not converting time data to string')
         self.assertIn('T', r['adatetime'], 'Not formatting datetime string 1 with T separator') 
-        self.assertIsInstance(r['strdt'], str, 'Not preserving string date data')
-        self.assertIsInstance(r['strdtm'], str, 'Not preserving string datetime data')
-        self.assertIsInstance(r['strtm'], str, 'Not preserving string time data')
         self.assertIn('T', r['strdtm'], 'Not formatting datetime string 2 with T separator') 
         
+    def test_output_settings(self):
+    
+        mydata = _build_mydata()
+        
+        # a separate store built with the string output settings (reconfigure is tested in test_store_data)
+        # its own database so an exclusive SQLite lock on the shared one does not matter
+        connect, t_sep, use_rowids, fresh_db = connect_string(self._testMethodName)
+        teststore = Store(connect, json_str_output = True, dates_str_output = True, bool_int_output = True, sqlite_t_sep=t_sep, has_rowids = use_rowids, sqlite_wal = settings.SQLITE_WAL)
+        self.addCleanup(self._store._apply_output_settings) # restore the (global SQLite) converters of the shared store
+        self.addCleanup(teststore.close)
+        dbtable = self._testMethodName + '_1'
+        if not fresh_db:
+            teststore.drop(dbtable, if_exists=True)
+        teststore.create(table_name=dbtable, data=mydata)
+        teststore.save( data=mydata, table_name=dbtable, commit=True)
+        r = teststore.select(table_name=dbtable)[0]
+        self.check_types(r, STRING_OUTPUT_TYPES)
+        self.assertNotIsInstance(r['atrue'], bool, 'Not converting boolean data to integer') # note boolean is int so isinstance(int) does not work
+        
     def test_date_functions(self):   
 
         applics = [
@@ -182,22 +258,26 @@ def test_date_functions(self):
             ]
     
         dbtable = self._testMethodName
-        connect, t_sep, use_rowids = connect_string(dbtable)
-        teststore = Store(connect, sqlite_t_sep=t_sep, has_rowids = use_rowids)
-        teststore.drop(dbtable, if_exists=True)
-        teststore.create(table_name=dbtable, data={ 'authority': 'dummy', 'uid': 'xxx', 'date_scraped': datetime.now(), 
-                'start_date': date.today(), 'decided_date': date.today(),
+        t_sep = self._t_sep
+        teststore = self._store
+        if not self._fresh_db:
+            teststore.drop(dbtable, if_exists=True)
+        now = datetime.now()
+        teststore.create(table_name=dbtable, data={ 'authority': 'dummy', 'uid': 'xxx', 'date_scraped': now, 
+                'start_date': now.date(), 'decided_date': now.date(),
                 } )
         
-        teststore.save( data=applics, table_name=dbtable, commit=True)
+        teststore.save_many( data=applics, table_name=dbtable, commit=False) # rows with identical keys in one executemany
+        teststore.commit() # one commit for the setup
         
         fixed_date_tests = { # all match 3 records above
             'ISO date': '1974-06-01', 
             'ISO datetime T separator': '1974-06-01T01:01:01',
             'ISO datetime space separator': '1974-06-01 01:01:01',
-            'date object': date(1974, 6, 1),
-            'datetime object': datetime(1974,6,1,1,1,1),
+            'date object': date.fromisoformat('1974-06-01'), # same values as the strings above
+            'datetime object': datetime.fromisoformat('1974-06-01T01:01:01'),
         }
+        ph_conditions = "date_scraped > ?" # same SQL for every placeholder comparison, only the bound value changes
         for fail_msg, val in fixed_date_tests.items():
             conditions = "date_scraped > %s" % teststore.sql_dt(val) 
             #print (conditions)
@@ -209,9 +289,7 @@ def test_date_functions(self):
             self.assertEqual(len(result), 3, 'SQL fixed datetime comparison using %s failing' % fail_msg)
             if teststore.db_type != 'SQLITE' or ('T separator' in fail_msg and t_sep) or \
                     ('space separator' in fail_msg and not t_sep): # datetime separator is significant in SQLite
-                conditions = "date_scraped > ?" 
-                #print (conditions)
-                result = teststore.select(table_name=dbtable, params=[val],conditions=conditions )
+                result = teststore.select(table_name=dbtable, params=[val], conditions=ph_conditions)
                 self.assertEqual(len(result), 3, 'SQL placeholder comparison using %s failing' % fail_msg)
         
         sql_week_after_decn = teststore.sql_dt_inc('decided_date', inc=7)
@@ -226,23 +304,35 @@ def test_date_functions(self):
             result = teststore.select(table_name=dbtable, fields=bef_fields, conditions=bef_conditions)
             self.assertEqual(len(result), 3, 'sql_before_dtm function not working')
         
-        teststore.delete( table_name=dbtable, conditions='1=1')
+        setup_count = teststore.count(table_name=dbtable)
+        teststore.delete( table_name=dbtable, conditions='1=1', commit=False) # delete and save in one transaction
         
         applics = [{ 'authority': 'Dummy', 'uid': 'applic0', 'start_date': '1974-05-01', 'decided_date': '1974-06-01',
             'date_scraped': '1974-05-23T12:06:06' }, # scraped one week before decided_date
             { 'authority': 'Dummy', 'uid': 'applic1', 'start_date': '1974-05-01', 'decided_date': None,
             'date_scraped': '1974-05-23T12:06:06' }, # scraped one week before decided_date
             ]
-        teststore.save( data=applics, table_name=dbtable, commit=True)
+        teststore.save_many( data=applics, table_name=dbtable, commit=False)
+        teststore.rollback() # the delete and the save are undone together
+        self.assertEqual(teststore.count(table_name=dbtable), setup_count, 'save_many not saving in the current transaction')
+        
+        teststore.delete( table_name=dbtable, conditions='1=1', commit=False) 
+        teststore.save_many( data=applics, table_name=dbtable, commit=False)
+        teststore.commit()
+        with self.assertRaises(ValueError, msg='save_many accepting rows with different keys'):
+            teststore.save_many( data=[ { 'uid': 'applic2' }, { 'authority': 'Dummy' } ], table_name=dbtable)
+        with self.assertRaises(ValueError, msg='save_columnar accepting columns of different lengths'):
+            teststore.save_columnar([ 'uid', 'authority' ], [ [ 'applic2', 'applic3', 'applic4' ], [ 'Dummy' ] ], table_name=dbtable)
         
         result = teststore.select(table_name=dbtable, conditions=iso_conditions) # excludes anything scraped > 1 week after decided date
         self.assertEqual(len(result), 1, 'sql_dt_inc function with null date not working')
 
     def test_store_vars(self):
     
-        anobj = TestClass() 
+        anobj = TEST_OBJ # shared instance - only the type is checked
         strvar = u'xxxxx'
         binvar = b'xyx'
+        now = datetime.now()
         mydata = {
             'uid': 'xxx',
             'atrue': True,
@@ -250,9 +340,9 @@ def test_store_vars(self):
             'floating': 0.346,
             'somebytes': b'xaxy', 
             'unicode': u'blingblangy\u00e9\u00f8C', # e acute + degree
-            'adate': date.today(),
-            'atime': datetime.now().time(),
-            'adatetime': datetime.now(),
+            'adate': now.date(),
+            'atime': now.time(),
+            'adatetime': now,
             'jsonobj': { 'uni': u'123 \u0115\u00f8C', 'data': 999.99, 'default': 'def' }, # e caron + degree
             #'isodate': '1973-01-01', 
             'atuple': ( 1, '2', 3.0 ),
@@ -262,22 +352,29 @@ def test_store_vars(self):
             'object': anobj,
             }
             
-        connect, t_sep, use_rowids = connect_string(self._testMethodName)
-        teststore = Store(connect, json_str_output=True, dates_str_output=True, sqlite_t_sep=t_sep, has_rowids = use_rowids) # note the string output settings should be ignored for vars
+        teststore = self._store
+        teststore.reconfigure(json_str_output = True, dates_str_output = True) # note the string output settings should be ignored for vars
+        self.addCleanup(teststore.reconfigure, json_str_output = False, dates_str_output = False)
         teststore.clear_vars()
         
-        for k, v in mydata.items():
-            teststore.set_var(k, v)
-        for k, v in mydata.items():
-            storev = teststore.get_var(k)
-            #print(v, storev, type(v), type(storev))
-            if isinstance(v, TestClass):
-                self.assertEqual(type(v), type(storev), 'Failed to set/get identical class types: %s -> %s' % (str(v), str(storev)))
-            elif teststore.db_type == 'SQLSERVER' and isinstance(v, time): # ignore microseconds in SQL Server tests = missing
-                newv = v.replace(microsecond = 0)
-                self.assertEqual(newv, storev, 'Failed to set/get identical variable: %s -> %s' % (str(newv), str(storev)))
-            else:
-                self.assertEqual(v, storev, 'Failed to set/get identical variable: %s -> %s' % (str(v), str(storev)))
+        for k, v in mydata.items(): # one transaction for all the variables
+            teststore.set_var(k, v, commit=False)
+        teststore.commit()
+        single = { k: teststore.get_var(k) for k in mydata }
+        teststore.clear_vars()
+        teststore.set_vars(mydata) # one executemany per variable type
+        batch = teststore.get_vars(mydata.keys()) # one query for all the variables
+        for how, stored in [ ('set_var/get_var', single), ('set_vars/get_vars', batch) ]:
+            for k, v in mydata.items():
+                storev = stored[k]
+                #print(v, storev, type(v), type(storev))
+                if isinstance(v, TestClass):
+                    self.assertEqual(type(v), type(storev), 'Failed to %s identical class types: %s -> %s' % (how, str(v), str(storev)))
+                elif teststore.db_type == 'SQLSERVER' and isinstance(v, time): # ignore microseconds in SQL Server tests = missing
+                    newv = v.replace(microsecond = 0)
+                    self.assertEqual(newv, storev, 'Failed to %s identical variable: %s -> %s' % (how, str(newv), str(storev)))
+                else:
+                    self.assertEqual(v, storev, 'Failed to %s identical variable: %s -> %s' % (how, str(v), str(storev)))
         k = 'newstr'
         teststore.set_var(k, 'testval')
         teststore.set_var(k, 'testval2')
@@ -286,19 +383,22 @@ def test_store_vars(self):
         teststore.set_var(k, None)
         storev = teststore.get_var(k)
         self.assertIsNone(storev, 'Failed to clear variable')
+        teststore.set_vars({ k: 'testval3', 'strvar': None }) # mixed replace and delete
+        stored = teststore.get_vars([ k, 'strvar' ], default='missing')
+        self.assertEqual({ k: 'testval3', 'strvar': 'missing' }, stored, 'Failed to set/clear several variables')
         
     def test_save_data(self):    
     
-        connect, t_sep, use_rowids = connect_string(self._testMethodName)
-        teststore = Store(connect, sqlite_t_sep=t_sep, has_rowids = use_rowids)
+        use_rowids = self._use_rowids
+        teststore = self._store
         dbtable = self._testMethodName + '_1'
-        teststore.drop(dbtable, if_exists=True)
+        if not self._fresh_db:
+            teststore.drop(dbtable, if_exists=True)
         
         firstdata = {  'field1': 'xxx', 'field2': 'yyy' }
         seconddata = {  'field1': 'xxx', 'field3': 'zzz' }
         
-        teststore.save( data=firstdata, table_name=dbtable, commit=True)
-        teststore.save( data=seconddata, table_name=dbtable, commit=True)
+        teststore.save( data=[ firstdata, seconddata ], table_name=dbtable, commit=True)
         
         count = teststore.count(table_name=dbtable) 
         icol = teststore.column_info(table_name=dbtable) 
@@ -307,9 +407,18 @@ def test_save_data(self):
             self.assertEqual(len(icol), 4, 'Failed to add new columns from data') # includes rowid column
         else:
             self.assertEqual(len(icol), 3, 'Failed to add new columns from data') # no rowid column
+        add_column = 'ADD' if teststore.db_type == 'SQLSERVER' else 'ADD COLUMN'
+        teststore.connection.cursor().execute('ALTER TABLE %s %s field4 varchar(20);' % (teststore.iquote(dbtable), add_column)) # bypasses the store
+        teststore.commit()
+        self.assertEqual(teststore.column_info(table_name=dbtable), icol, 'Failed to cache column information')
+        teststore.refresh_schema(dbtable) # cached column information is discarded and read again
+        self.assertIn('field4', teststore.column_info(table_name=dbtable), 'Failed to refresh column information')
+        teststore.save_many([ { 'FIELD1': 'aaa', 'Field3': 'bbb' } ], table_name=dbtable, commit=True) # same columns in a different case
+        self.assertEqual(teststore.count(table_name=dbtable), 3, 'Failed to save columns in a different case')
         
         dbtable = self._testMethodName + '_2'
-        teststore.drop(dbtable, if_exists=True)
+        if not self._fresh_db:
+            teststore.drop(dbtable, if_exists=True)
         
         sampledata = { 'key1': '1', 'key2': '2' }
         
@@ -326,10 +435,7 @@ def test_save_data(self):
         keydata2 = {  'key1': '1', 'key2': '2', 'field1': 'aaa', 'field2': 'bbb' }
         keydata3 = {  'key1': '1', 'key2': '3', 'field1': 'xxx', 'field2': 'yyy' }
         
-        teststore.save( data=keydata1, table_name=dbtable, commit=False)
-        teststore.save( data=keydata2, table_name=dbtable, commit=False)
-        teststore.save( data=keydata3, table_name=dbtable, commit=False)
-        teststore.commit()
+        teststore.save( data=[ keydata1, keydata2, keydata3 ], table_name=dbtable, commit=True) # keydata2 replaces keydata1
         
         matched = {  'key1': '1', 'key2': '2' }
         retrieved = teststore.match_select(matched, table_name=dbtable)
@@ -351,7 +457,8 @@ def test_save_data(self):
         self.assertIsNone(r['field2'], 'Failed to replace old fields with null') # first record overwritten
         
         dbtable = self._testMethodName + '_3'
-        teststore.drop(dbtable, if_exists=True)
+        if not self._fresh_db:
+            teststore.drop(dbtable, if_exists=True)
         
         weird_col_name = """no^[hs!'`e]?''sf_"&'"""
         unicode_col_name = u'blingblangy\u00e9\u00f8C' # e acute + degree
@@ -368,7 +475,8 @@ def test_save_data(self):
         self.assertIn(unicode_col_name, cols, 'Failed to create quoted column with unicode name') 
         
         dbtable = 'dbtruckdata'
-        teststore.drop(dbtable, if_exists=True)
+        if not self._fresh_db:
+            teststore.drop(dbtable, if_exists=True)
         
         r1 = teststore.save( {"name":"Thomas","surname":"Levine"} )
         r2 = teststore.save( [{"surname": "Smith"}, {"surname": "Jones", "title": "Mr"}] ) 
@@ -385,7 +493,7 @@ def test_save_data(self):
         #print(dict(odata[1]))
         
         dbtable = 'dbtruckdata'
-        teststore.drop(dbtable, if_exists=True)
+        teststore.drop(dbtable, if_exists=True) # always required - created above
         
         r3 = teststore.save( [ {"name":"Thomas"}, {"surname":"Levine"}, {"title": "Mr"} ] ) # make 3 columns in successive insertions
         if use_rowids:
@@ -394,7 +502,8 @@ def test_save_data(self):
             self.assertEqual(r3, 3, 'Failed to return count from successive inserts') 
         
         dbtable = self._testMethodName + '_4'
-        teststore.drop(dbtable, if_exists=True)
+        if not self._fresh_db:
+            teststore.drop(dbtable, if_exists=True)
         
         data = [ {  'field1': 'xxx', 'field2': 'yyy' },
             { 'field1': 'xxx', 'field3': 'zzz' },
@@ -410,51 +519,28 @@ def test_save_data(self):
     
     def test_select_data(self):    
     
-        connect, t_sep, use_rowids = connect_string(self._testMethodName)
-        teststore = Store(connect, sqlite_t_sep=t_sep, has_rowids = use_rowids)
+        use_rowids = self._use_rowids
+        teststore = self._store
         
         # booleans
         dbtable = self._testMethodName + '_1'
-        teststore.drop(dbtable, if_exists=True)
+        if not self._fresh_db:
+            teststore.drop(dbtable, if_exists=True)
         data = {  'atrue': True, 'afalse': True, 'anull': True  }
         teststore.create_table( data=data, table_name=dbtable)
         data = {  'atrue': True, 'afalse': False, 'anull': None  }
         teststore.insert( data=data, table_name=dbtable, commit=True)
 
-        if teststore.db_type == 'SQLSERVER':
-            selected = teststore.select(table_name=dbtable, conditions='atrue=1')
-            self.assertEqual(len(selected), 1, 'Failed to select boolean true as 1')
-            selected = teststore.select(table_name=dbtable, conditions='atrue=0')
-            self.assertEqual(len(selected), 0, 'Failed to ignore boolean true as 0')
-            
-            selected = teststore.select(table_name=dbtable, conditions='afalse=0')
-            self.assertEqual(len(selected), 1, 'Failed to select boolean false as 0')
-            selected = teststore.select(table_name=dbtable, conditions='afalse=1')
-            self.assertEqual(len(selected), 0, 'Failed to ignore boolean false as 1')
-            
-            selected = teststore.select(table_name=dbtable, conditions='anull=1')
-            self.assertEqual(len(selected), 0, 'Failed to ignore null with =1 boolean test')
-            selected = teststore.select(table_name=dbtable, conditions='anull=0')
-            self.assertEqual(len(selected), 0, 'Failed to ignore null with =0 boolean tes')
-        else:
-            selected = teststore.select(table_name=dbtable, conditions='atrue')
-            self.assertEqual(len(selected), 1, 'Failed to select boolean true as true')
-            selected = teststore.select(table_name=dbtable, conditions='not atrue')
-            self.assertEqual(len(selected), 0, 'Failed to ignore boolean true as not true')
-            
-            selected = teststore.select(table_name=dbtable, conditions='not afalse')
-            self.assertEqual(len(selected), 1, 'Failed to select boolean false as not true')
-            selected = teststore.select(table_name=dbtable, conditions='afalse')
-            self.assertEqual(len(selected), 0, 'Failed to ignore boolean false as true')
-            
-            selected = teststore.select(table_name=dbtable, conditions='anull')
-            self.assertEqual(len(selected), 0, 'Failed to ignore null with implicit boolean true')
-            selected = teststore.select(table_name=dbtable, conditions='not anull')
-            self.assertEqual(len(selected), 0, 'Failed to ignore null with implicit boolean false')
+        cases = SQLSERVER_BOOLEAN_CASES if teststore.db_type == 'SQLSERVER' else BOOLEAN_CASES
+        for conditions, expected, msg in cases: # all against the same single row fixture
+            with self.subTest(conditions=conditions):
+                selected = teststore.select(table_name=dbtable, conditions=conditions)
+                self.assertEqual(len(selected), expected, msg)
         
         #list_select and dict_select
         dbtable = self._testMethodName + '_2'
-        teststore.drop(dbtable, if_exists=True)
+        if not self._fresh_db:
+            teststore.drop(dbtable, if_exists=True)
         
         data = [ 
             { 'surname': 'Brunel', 'forename': 'Isambard' },
@@ -465,8 +551,15 @@ def test_select_data(self):
         teststore.insert( data=data, table_name=dbtable, commit=True)
         selected = teststore.list_select(key_field='surname', match_list=[ 'Brunel', 'Watt'], table_name=dbtable)
         self.assertEqual(len(selected), 3, 'Failed to select using list')
-        selected = teststore.match_select(match_dict={ 'surname': 'Brunel', 'forename': 'Isambard' }, table_name=dbtable)
-        self.assertEqual(len(selected), 1, 'Failed to select using dict')
+        selected = [ r for r in selected if r['surname'] == 'Brunel' and r['forename'] == 'Isambard' ] # one query, filtered here (match_select is tested in test_save_data)
+        self.assertEqual(len(selected), 1, 'Failed to select using list and filter')
+        
+        #select_columnar
+        selected = teststore.select_columnar(fields=['surname', 'forename'], table_name=dbtable, conditions='surname = ?', params=['Brunel'])
+        self.assertEqual(list(selected.keys()), ['surname', 'forename'], 'Failed to select columns')
+        self.assertEqual(sorted(selected['forename']), ['Isambard', 'Mark'], 'Failed to select column values')
+        selected = teststore.select_columnar(table_name=dbtable, conditions='surname = ?', params=['Nobody'])
+        self.assertTrue(all(v == [] for v in selected.values()), 'Failed to select empty columns')
         
         #indexes
         #print(teststore.column_info(dbtable))
@@ -478,6 +571,39 @@ def test_select_data(self):
         inds = teststore.indices(table_name=dbtable)
         self.assertEqual(len(inds), 0, 'Failed to drop index')
         
+    def test_dump_load(self):
+    
+        teststore = self._store
+        dbtable = self._testMethodName + '_1'
+        loadtable = self._testMethodName + '_2'
+        if not self._fresh_db:
+            teststore.drop(dbtable, if_exists=True)
+            teststore.drop(loadtable, if_exists=True)
+        fields = [ 'id', 'name', 'mixed', 'blank' ]
+        teststore.create_table(data={ 'id': 1, 'name': 'x', 'mixed': 'x', 'blank': 'x' }, table_name=dbtable)
+        data = [ { 'id': i, 'name': 'name%d' % i if i % 10 else '', 'mixed': 'text%d' % i } for i in range(1, 151) ] # 'blank' is always null
+        teststore.insert(data=data, table_name=dbtable, commit=True)
+        
+        fd, csv_file = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        self.addCleanup(os.remove, csv_file)
+        teststore.dump_to(csv_file, fields=fields, table_name=dbtable)
+        with open(csv_file, 'a') as f: # rows beyond the 100 row sample
+            writer = csv.writer(f, quoting=csv.QUOTE_NONNUMERIC)
+            writer.writerow([ 151, 'name151', 7, None ]) # number in a text column
+            writer.writerow([ 152, 'name152' ]) # short row
+        teststore.load_from(csv_file, table_name=loadtable)
+        
+        loaded = { r['id']: r for r in teststore.select(table_name=loadtable) }
+        self.assertEqual(len(loaded), 152, 'Failed to load all rows')
+        self.assertTrue(all(type(k) is int for k in loaded), 'Failed to convert integral floats to int')
+        self.assertEqual(loaded[20]['name'], None, 'Failed to convert empty string to null')
+        self.assertEqual(loaded[21]['name'], 'name21', 'Failed to load string')
+        self.assertEqual(loaded[100]['mixed'], 'text100', 'Failed to load sampled column')
+        self.assertEqual(str(loaded[151]['mixed']), '7', 'Failed to convert value of a different type after the sample')
+        self.assertEqual((loaded[152]['name'], loaded[152]['mixed']), ('name152', None), 'Failed to pad short row')
+        self.assertTrue(all(r.get('blank') is None for r in loaded.values()), 'Failed to load all null column')
+        
 
 if __name__ == '__main__':
     